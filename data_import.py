@@ -1,23 +1,62 @@
 import argparse
+import codecs
+import contextlib
 import csv
+import functools
 import gzip
 import hashlib
+import io
 import json
 import os
 import random
 import shutil
+import subprocess
 import sys
-import tarfile
 import tempfile
+import threading
+import time
 import urllib.error
 import urllib.parse
-import urllib.request
 from pathlib import Path
-from typing import BinaryIO, Optional, cast
+from typing import BinaryIO, Iterable, Iterator, Optional, TextIO, cast
+
+# urllib.request, concurrent.futures and tarfile are imported where they are
+# used: they are most of the import time, and neither --help nor the scan
+# workers need them.
 
 # Base URL for raw downloads (GitHub raw endpoint via github.com)
 BASE_URL = "https://github.com/kaae-2/ob-flow-datasets/raw/main"
 
+# Downloads are latency-bound, so fetch this many files concurrently.
+DOWNLOAD_WORKERS = 16
+# Transient failures (rate limits, 5xx, dropped connections) are retried this
+# many times with exponential backoff, honouring Retry-After when given.
+DOWNLOAD_RETRIES = 4
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Upper bound on a server-requested Retry-After, in seconds.
+_MAX_RETRY_DELAY = 60.0
+# Socket timeout in seconds for each connect or read. A stalled transfer
+# raises TimeoutError and is retried instead of hanging its thread.
+HTTP_TIMEOUT = 60.0
+
+# zstd decoding amortizes per-call overhead much better with MiB-sized buffers.
+ZSTD_IO_SIZE = 1 << 20
+
+# Source file suffixes and the type each one decodes as. Multi-part zstd
+# sources are named <base>.csv.zst.partNNN.
+_SUFFIX_TYPES = ((".csv", "csv"), (".csv.gz", "gz"), (".csv.zst", "zst"))
+_PART_MARKER = ".csv.zst.part"
+# When several encodings of one sample are published, prefer the cheapest to decode.
+_SOURCE_PRIORITY = ("csv", "gz", "zst", "zst_parts")
+
+# Per-thread keep-alive connections for file downloads, keyed by (scheme, host).
+# Each thread's pool is also registered so _close_connections can close them all.
+_CONNECTIONS = threading.local()
+_CONNECTION_POOLS: list[dict] = []
+_CONNECTION_POOLS_LOCK = threading.Lock()
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 5
+
 LABEL_COLUMN_CANDIDATES = (
     "label",
     "population",
@@ -27,27 +66,291 @@ LABEL_COLUMN_CANDIDATES = (
     "cluster_id",
 )
 
+_OUTPUT_LOCK = threading.Lock()
+
+
+def _log(message: str, file: Optional[TextIO] = None) -> None:
+    # Downloads report from many threads at once. print() writes the text and
+    # the newline separately, so lines could interleave; write each one whole.
+    stream = file if file is not None else sys.stdout
+    with _OUTPUT_LOCK:
+        stream.write(message + "\n")
+
+
+def _pooled_connection(scheme: str, netloc: str, fresh: bool = False):
+    import http.client
+
+    pool = getattr(_CONNECTIONS, "pool", None)
+    if not pool:
+        # Pools emptied by _close_connections are no longer registered.
+        pool = _CONNECTIONS.pool = {}
+        with _CONNECTION_POOLS_LOCK:
+            _CONNECTION_POOLS.append(pool)
+    key = (scheme, netloc)
+    conn = pool.get(key)
+    if conn is None or fresh:
+        if conn is not None:
+            conn.close()
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(netloc, timeout=HTTP_TIMEOUT)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=HTTP_TIMEOUT)
+        pool[key] = conn
+    return conn
+
+
+def _close_connections() -> None:
+    # Only call once no download is in flight; the pools belong to other threads.
+    with _CONNECTION_POOLS_LOCK:
+        pools = list(_CONNECTION_POOLS)
+        _CONNECTION_POOLS.clear()
+    for pool in pools:
+        for conn in pool.values():
+            conn.close()
+        pool.clear()
+
+
+def _uses_proxy(url: str) -> bool:
+    import urllib.request
+
+    # getproxies() also reports no_proxy (as "no"), so look up this scheme only.
+    parts = urllib.parse.urlsplit(url)
+    if not urllib.request.getproxies().get(parts.scheme):
+        return False
+    return not urllib.request.proxy_bypass(parts.hostname or "")
+
+
+def _open_url(request):
+    # urllib sends "Connection: close" and opens a new TCP+TLS connection per
+    # request. GETs here reuse one connection per host and thread instead, and
+    # mirror urlopen: redirects are followed and statuses >= 300 (including
+    # 304) raise HTTPError. Hosts reached through a proxy keep using urllib.
+    import http.client
+    import urllib.request
+
+    url = request.full_url
+    headers = dict(request.header_items())
+    if not request.has_header("User-agent"):
+        # Send the same default User-Agent as urllib; GitHub rejects requests without one.
+        headers["User-Agent"] = f"Python-urllib/{sys.version_info[0]}.{sys.version_info[1]}"
+    for _ in range(_MAX_REDIRECTS + 1):
+        if _uses_proxy(url):
+            return urllib.request.urlopen(
+                urllib.request.Request(url, headers=headers), timeout=HTTP_TIMEOUT
+            )
+        parts = urllib.parse.urlsplit(url)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        conn = _pooled_connection(parts.scheme, parts.netloc)
+        reused = conn.sock is not None
+        try:
+            try:
+                conn.request("GET", target, headers=headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                if not reused:
+                    raise
+                # The server may have dropped an idle keep-alive connection.
+                conn = _pooled_connection(parts.scheme, parts.netloc, fresh=True)
+                conn.request("GET", target, headers=headers)
+                response = conn.getresponse()
+        except OSError as exc:
+            # Connection failures (DNS, TLS, refused) surface as URLError, as with urlopen.
+            conn.close()
+            raise urllib.error.URLError(exc) from exc
+        except http.client.HTTPException:
+            conn.close()
+            raise
+
+        if response.status < 300:
+            return response
+        # Drain the body so the connection can be reused for the next request.
+        body = response.read()
+        location = response.headers.get("Location")
+        if response.status in _REDIRECT_CODES and location:
+            url = urllib.parse.urljoin(url, location)
+            continue
+        raise urllib.error.HTTPError(
+            url, response.status, response.reason, response.headers, io.BytesIO(body)
+        )
+    raise urllib.error.URLError(f"too many redirects for {request.full_url}")
+
+
+def download_file(
+    url: str, dest_path: str, chunk_size: int = 1 << 20, cache_dir: Optional[str] = None
+) -> bool:
+    import http.client
+    import ssl
+    import urllib.request
 
-def download_file(url: str, dest_path: str, chunk_size: int = 8192) -> bool:
     if not url or not dest_path:
         raise ValueError("Both url and dest_path must be provided.")
 
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    try:
-        with urllib.request.urlopen(url) as response, open(dest_path, "wb") as out_file:
-            while chunk := response.read(chunk_size):
-                out_file.write(chunk)
-        print(f"Downloaded {url} -> {dest_path}")
-        return True
-    except urllib.error.HTTPError as e:
-        print(f"HTTP error for {url}: {e.code} {e.reason}")
-    except urllib.error.URLError as e:
-        print(f"Network error for {url}: {e.reason}")
-    except Exception as e:
-        print(f"Unexpected error for {url}: {e}")
+    request = urllib.request.Request(url)
+    cached = None
+    if cache_dir:
+        blob_path, meta_path = _cache_paths(cache_dir, url)
+        meta = _read_cache_meta(meta_path)
+        if (
+            meta
+            and meta.get("etag")
+            and blob_path.is_file()
+            and blob_path.stat().st_size == meta.get("size")
+        ):
+            request.add_header("If-None-Match", meta["etag"])
+            cached = blob_path
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        retry_after = None
+        try:
+            with _open_url(request) as response, open(dest_path, "wb") as out_file:
+                shutil.copyfileobj(response, out_file, length=chunk_size)
+                # Sized reads return short at EOF instead of raising, so check
+                # that the whole Content-Length actually arrived.
+                if getattr(response, "length", None):
+                    raise http.client.IncompleteRead(b"", response.length)
+                etag = response.headers.get("ETag")
+            _log(f"Downloaded {url} -> {dest_path}")
+            if cache_dir and etag:
+                _store_cached_file(cache_dir, url, etag, Path(dest_path))
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None:
+                _link_or_copy(cached, Path(dest_path))
+                _log(f"Unchanged {url} -> {dest_path} (from cache)")
+                return True
+            error = f"HTTP error for {url}: {e.code} {e.reason}"
+            if e.code not in _RETRY_STATUSES:
+                _log(error)
+                return False
+            retry_after = e.headers.get("Retry-After") if e.headers else None
+        except urllib.error.URLError as e:
+            error = f"Network error for {url}: {e.reason}"
+        except (http.client.HTTPException, ConnectionError, TimeoutError, ssl.SSLError) as e:
+            # Connection dropped, timed out or broke TLS mid-transfer. Connection
+            # setup failures (DNS, handshake) already arrive as URLError.
+            error = f"Network error for {url}: {e!r}"
+        except Exception as e:
+            _log(f"Unexpected error for {url}: {e}")
+            return False
+
+        if attempt == DOWNLOAD_RETRIES:
+            _log(error)
+            break
+        delay = _retry_delay(attempt, retry_after)
+        _log(f"{error}; retrying in {delay:.1f}s")
+        time.sleep(delay)
     return False
 
 
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    # Retry-After may also be an HTTP date; only the delay-seconds form is used.
+    if retry_after and retry_after.strip().isdigit():
+        return min(float(retry_after.strip()), _MAX_RETRY_DELAY)
+    return 2**attempt + random.random()
+
+
+def _cache_paths(cache_dir: str, url: str) -> tuple[Path, Path]:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return Path(cache_dir) / f"{key}.blob", Path(cache_dir) / f"{key}.json"
+
+
+def _read_cache_meta(meta_path: Path) -> Optional[dict]:
+    try:
+        return json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache_meta(meta_path: Path, meta: dict) -> None:
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = meta_path.with_name(f"{meta_path.name}.tmp")
+    tmp_path.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp_path, meta_path)
+
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    # Hard links make cache hits free when the cache shares a filesystem with dest.
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+def _store_cached_file(cache_dir: str, url: str, etag: str, path: Path) -> None:
+    blob_path, meta_path = _cache_paths(cache_dir, url)
+    try:
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_blob = blob_path.with_name(f"{blob_path.name}.tmp")
+        tmp_blob.unlink(missing_ok=True)
+        _link_or_copy(path, tmp_blob)
+        os.replace(tmp_blob, blob_path)
+        _write_cache_meta(
+            meta_path, {"url": url, "etag": etag, "size": path.stat().st_size}
+        )
+    except OSError as exc:
+        _log(f"Warning: could not cache {url}: {exc}", file=sys.stderr)
+
+
+@contextlib.contextmanager
+def _open_parallel_gzip(path: str, level: int = 6) -> Iterator[BinaryIO]:
+    # Prefer multi-threaded gzip (pgzip, then pigz) and fall back to stdlib gzip.
+    # The yielded handle is write-only; pair it with tarfile's streaming "w|" mode.
+    threads = os.cpu_count() or 1
+    try:
+        import pgzip  # type: ignore
+    except Exception:
+        pgzip = None
+
+    if pgzip is not None:
+        with pgzip.open(path, "wb", compresslevel=level, thread=threads, blocksize=2**20) as fh:
+            yield cast(BinaryIO, fh)
+        return
+
+    pigz = shutil.which("pigz")
+    if pigz is not None:
+        with open(path, "wb") as out_file:
+            proc = subprocess.Popen(
+                [pigz, f"-{level}", "-n", "-p", str(threads), "-c"],
+                stdin=subprocess.PIPE,
+                stdout=out_file,
+            )
+            try:
+                yield cast(BinaryIO, proc.stdin)
+            finally:
+                cast(BinaryIO, proc.stdin).close()
+                returncode = proc.wait()
+        if returncode != 0:
+            raise RuntimeError(f"pigz exited with status {returncode} while writing {path}.")
+        return
+
+    # mtime=0 keeps the gzip header, and so the output, stable across runs.
+    with gzip.GzipFile(path, "wb", compresslevel=level, mtime=0) as fh:
+        yield cast(BinaryIO, fh)
+
+
+@contextlib.contextmanager
+def _open_zstd_writer(path: str) -> Iterator[BinaryIO]:
+    import zstandard as zstd  # type: ignore
+
+    # threads=-1 lets libzstd compress frames on every core.
+    cctx = zstd.ZstdCompressor(level=3, threads=-1, write_checksum=True)
+    with open(path, "wb") as out_file, cctx.stream_writer(
+        out_file, write_size=ZSTD_IO_SIZE
+    ) as zw:
+        yield cast(BinaryIO, zw)
+
+
+def _open_archive_writer(path: str, compression: str, gzip_level: int = 6):
+    if compression == "zst":
+        return _open_zstd_writer(path)
+    if compression == "gz":
+        return _open_parallel_gzip(path, gzip_level)
+    if compression == "none":
+        return open(path, "wb")
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+@functools.lru_cache(maxsize=None)
 def _extract_repo_info(base_url: str):
     parsed = urllib.parse.urlparse(base_url)
     parts = parsed.path.strip("/").split("/")
@@ -57,80 +360,119 @@ def _extract_repo_info(base_url: str):
     return None
 
 
-def _validate_csv_file(path: Path) -> None:
-    size = path.stat().st_size
-    if size == 0:
-        raise ValueError("CSV file is empty.")
+def _classify(name: str) -> tuple[str, Optional[str]]:
+    lower = name.lower()
+    idx = lower.find(_PART_MARKER)
+    if idx != -1:
+        return name[:idx], "zst_parts"
+    for suffix, typ in _SUFFIX_TYPES:
+        if lower.endswith(suffix):
+            return name[: -len(suffix)], typ
+    return name, None
 
-    with open(path, "rb+") as fh:
-        fh.seek(0, os.SEEK_END)
-        if fh.tell() == 0:
-            raise ValueError("CSV file is empty.")
-        fh.seek(-1, os.SEEK_END)
-        if fh.read(1) != b"\n":
-            fh.seek(0, os.SEEK_END)
-            fh.write(b"\n")
 
-    with open(path, "r", encoding="utf-8", newline="") as fh:
-        reader = csv.reader(fh)
-        try:
-            header = next(reader)
-        except StopIteration as exc:
-            raise ValueError("CSV file has no header row.") from exc
-
-        expected = len(header)
-        if expected == 0:
-            raise ValueError("CSV header has no columns.")
-
-        for idx, row in enumerate(reader, start=2):
-            if len(row) != expected:
-                raise ValueError(
-                    f"Row {idx} has {len(row)} columns (expected {expected})."
-                )
+def _load_json(response: BinaryIO):
+    try:
+        import orjson  # type: ignore
+    except ImportError:
+        return json.load(response)
+    return orjson.loads(response.read())
 
 
-def _list_prepared_files(dataset_name: str) -> list[dict]:
-    repo_info = _extract_repo_info(BASE_URL)
-    if not repo_info:
-        raise ValueError("BASE_URL must be a GitHub raw URL to list prepared files.")
+def _next_page_url(link_header: Optional[str]) -> Optional[str]:
+    # GitHub paginates with Link headers: <url>; rel="next", <url>; rel="last"
+    if not link_header:
+        return None
+    for part in link_header.split(","):
+        url, _, params = part.partition(";")
+        if 'rel="next"' in params:
+            return url.strip().strip("<>")
+    return None
 
-    list_url = (
-        "https://api.github.com/repos/"
-        f"{repo_info['owner']}/{repo_info['repo']}/contents/prepared/{dataset_name}"
-        f"?ref={repo_info['branch']}"
-    )
+
+def _fetch_listing_page(url: str, cache_dir: Optional[str] = None):
+    import urllib.request
+
+    request = urllib.request.Request(url, headers={"Accept": "application/vnd.github+json"})
+    meta = None
+    if cache_dir:
+        meta_path = _cache_paths(cache_dir, url)[1]
+        meta = _read_cache_meta(meta_path)
+        if meta and meta.get("etag") and "payload" in meta:
+            request.add_header("If-None-Match", meta["etag"])
+        else:
+            meta = None
 
     try:
-        with urllib.request.urlopen(list_url) as response:
-            payload = json.loads(response.read())
+        with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+            payload = _load_json(response)
+            etag = response.headers.get("ETag")
+            next_url = _next_page_url(response.headers.get("Link"))
+        if cache_dir and etag:
+            try:
+                _write_cache_meta(
+                    meta_path, {"url": url, "etag": etag, "payload": payload, "next": next_url}
+                )
+            except OSError as exc:
+                print(f"Warning: could not cache listing {url}: {exc}", file=sys.stderr)
     except urllib.error.HTTPError as e:
-        raise RuntimeError(f"HTTP error while listing prepared files: {e.code} {e.reason}") from e
+        if e.code != 304 or meta is None:
+            raise RuntimeError(
+                f"HTTP error while listing prepared files: {e.code} {e.reason}"
+            ) from e
+        # Not modified since the cached listing; conditional requests also do
+        # not count against GitHub's API rate limit.
+        payload = meta["payload"]
+        next_url = meta.get("next")
     except urllib.error.URLError as e:
         raise RuntimeError(f"Network error while listing prepared files: {e.reason}") from e
     except Exception as e:
         raise RuntimeError(f"Unexpected error while listing prepared files: {e}") from e
+    return payload, next_url
+
+
+def _iter_contents(
+    owner: str, repo: str, path: str, ref: str, cache_dir: Optional[str] = None
+) -> Iterator[dict]:
+    url: Optional[str] = (
+        f"https://api.github.com/repos/{owner}/{repo}/contents/{path}?ref={ref}&per_page=100"
+    )
+    while url:
+        payload, url = _fetch_listing_page(url, cache_dir)
+        if not isinstance(payload, list):
+            return
+        yield from payload
+
+
+def _list_prepared_files(dataset_name: str, cache_dir: Optional[str] = None) -> list[dict]:
+    repo_info = _extract_repo_info(BASE_URL)
+    if not repo_info:
+        raise ValueError("BASE_URL must be a GitHub raw URL to list prepared files.")
 
     files = []
-    if isinstance(payload, list):
-        for item in payload:
-            if item.get("type") != "file":
-                continue
-            name = item.get("name")
-            if not name:
-                continue
-            lower = name.lower()
-            is_data = (
-                lower.endswith(".csv")
-                or lower.endswith(".csv.gz")
-                or lower.endswith(".csv.zst")
-                or ".csv.zst.part" in lower
+    for item in _iter_contents(
+        repo_info["owner"],
+        repo_info["repo"],
+        f"prepared/{dataset_name}",
+        repo_info["branch"],
+        cache_dir,
+    ):
+        if item.get("type") != "file":
+            continue
+        name = item.get("name")
+        if not name:
+            continue
+        base, typ = _classify(name)
+        is_sha = typ is None and name.lower().endswith(".csv.zst.sha256")
+        if typ is None and not is_sha:
+            continue
+        download_url = item.get("download_url") or f"{BASE_URL}/prepared/{dataset_name}/{name}"
+        if is_sha:
+            files.append({"name": name, "url": download_url, "kind": "sha"})
+        else:
+            files.append(
+                {"name": name, "url": download_url, "kind": "data", "base": base, "typ": typ}
             )
-            is_sha = lower.endswith(".csv.zst.sha256")
-            if not (is_data or is_sha):
-                continue
-            download_url = item.get("download_url") or f"{BASE_URL}/prepared/{dataset_name}/{name}"
-            kind = "sha" if is_sha else "data"
-            files.append({"name": name, "url": download_url, "kind": kind})
     return files
 
 
@@ -141,23 +483,6 @@ def _read_sha256(sha_path: Path) -> str:
     return text.split()[0]
 
 
-def _file_sha256(path: Path) -> str:
-    digest = hashlib.sha256()
-    with path.open("rb") as fh:
-        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
-            digest.update(chunk)
-    return digest.hexdigest()
-
-
-def _verify_sha256(path: Path, sha_path: Path) -> None:
-    expected = _read_sha256(sha_path)
-    actual = _file_sha256(path)
-    if actual != expected:
-        raise ValueError(
-            f"SHA256 mismatch (expected {expected}, got {actual})."
-        )
-
-
 def _find_label_index(header: list[str]) -> Optional[int]:
     lower_map = {str(col).strip().lower(): idx for idx, col in enumerate(header)}
     for candidate in LABEL_COLUMN_CANDIDATES:
@@ -166,50 +491,334 @@ def _find_label_index(header: list[str]) -> Optional[int]:
     return None
 
 
-def _collect_dataset_metadata(csv_paths: list[Path]) -> dict:
-    sorted_paths = sorted(csv_paths, key=lambda p: p.name)
-    sample_names: list[str] = []
-    cells_per_sample: list[int] = []
+class _CountingReader(io.RawIOBase):
+    # Tracks the size, newline count and final byte of a stream as it is read.
+    # With check_utf8, invalid UTF-8 anywhere in the stream raises
+    # UnicodeDecodeError, as reading it through a utf-8 TextIOWrapper would.
+    def __init__(self, raw: BinaryIO, check_utf8: bool = False) -> None:
+        self.raw = raw
+        self.size = 0
+        self.newlines = 0
+        self.last_byte = b""
+        self.utf8 = codecs.getincrementaldecoder("utf-8")() if check_utf8 else None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self.raw.readinto(b)
+        if n:
+            chunk = bytes(memoryview(b)[:n])
+            self.size += n
+            self.newlines += chunk.count(b"\n")
+            self.last_byte = chunk[-1:]
+            if self.utf8 is not None:
+                self.utf8.decode(chunk)
+        elif self.utf8 is not None:
+            self.utf8.decode(b"", final=True)
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+
+class _ChainedReader(io.RawIOBase):
+    # Reads several streams back to back. Streams are pulled from the iterable
+    # only when needed, so a generator of open() calls keeps one file open.
+    def __init__(self, streams: Iterable[BinaryIO]) -> None:
+        self.streams = iter(streams)
+        self.current: Optional[BinaryIO] = next(self.streams, None)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while self.current is not None:
+            n = self.current.readinto(b)
+            if n:
+                return n
+            self.current.close()
+            self.current = next(self.streams, None)
+        return 0
+
+    def close(self) -> None:
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+class _HashingReader(io.RawIOBase):
+    # Feeds every byte read from the wrapped file into ``digest``. Closing hashes
+    # any unread tail so the digest always covers the whole file.
+    def __init__(self, raw: BinaryIO, digest) -> None:
+        self.raw = raw
+        self.digest = digest
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self.raw.readinto(b)
+        if n:
+            self.digest.update(memoryview(b)[:n])
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            for chunk in iter(lambda: self.raw.read(1 << 20), b""):
+                self.digest.update(chunk)
+            self.raw.close()
+        super().close()
+
+
+class _ChecksumError(ValueError):
+    pass
+
+
+def _open_source_bytes(entry: dict) -> BinaryIO:
+    # Multi-part sources are read as one stream; the parts are never joined on disk.
+    paths = entry["paths"]
+    if len(paths) == 1:
+        return cast(BinaryIO, open(paths[0], "rb"))
+    return cast(BinaryIO, _ChainedReader(open(p, "rb") for p in paths))
+
+
+def _open_csv_source(entry: dict, dctx=None, digest=None) -> BinaryIO:
+    if entry["typ"] == "gz":
+        return cast(BinaryIO, gzip.open(entry["paths"][0], "rb"))
+    raw = _open_source_bytes(entry)
+    if digest is not None:
+        raw = cast(BinaryIO, _HashingReader(raw, digest))
+    if entry["typ"] == "zst":
+        return cast(
+            BinaryIO,
+            dctx.stream_reader(raw, read_size=ZSTD_IO_SIZE, read_across_frames=True),
+        )
+    return raw
+
+
+def _load_pyarrow_csv():
+    try:
+        import pyarrow as pa  # type: ignore
+        import pyarrow.compute as pc  # type: ignore
+        import pyarrow.csv as pacsv  # type: ignore
+    except Exception:
+        return None
+    return pa, pc, pacsv
+
+
+def _scan_csv_source(entry: dict, dctx=None) -> dict:
+    # Entries with an expected SHA-256 are verified while they are decoded, so
+    # the compressed input is not read a separate time just for the checksum.
+    digest = hashlib.sha256() if entry.get("sha256") else None
+    arrow = _load_pyarrow_csv()
+    error: Optional[Exception] = None
+    sample = None
+    try:
+        sample = _scan_csv_stream(_open_csv_source(entry, dctx, digest), arrow)
+        if sample is None:
+            # The pyarrow fast path could not vouch for this file; the csv module
+            # has the final say (and reports the exact offending row).
+            sample = _scan_csv_stream(_open_csv_source(entry, dctx))
+    except Exception as exc:
+        error = exc
+    # A corrupt download usually breaks decoding first; report it as a checksum failure.
+    if digest is not None and digest.hexdigest() != entry["sha256"]:
+        raise _ChecksumError(
+            f"SHA256 mismatch (expected {entry['sha256']}, got {digest.hexdigest()})."
+        ) from error
+    if error is not None:
+        raise error
+    sample = cast(dict, sample)
+    sample["name"] = entry["arcname"]
+    return sample
+
+
+def _scan_csv_stream(raw: BinaryIO, arrow=None) -> Optional[dict]:
+    # Single pass over the decoded CSV: validates the column count of every row
+    # and gathers the per-sample metadata and byte size needed for the tarball.
+    # csv.reader decodes through TextIOWrapper; pyarrow only converts the label
+    # column, so the counter checks the encoding of every byte for it.
+    counter = _CountingReader(raw, check_utf8=arrow is not None)
+    with io.BufferedReader(counter, buffer_size=1 << 20) as fh:
+        if arrow is not None:
+            rows = _scan_rows_arrow(fh, counter, arrow)
+            if rows is None:
+                return None
+        else:
+            rows = _scan_rows_csv(fh, counter)
+
+    cell_count, populations = rows
+    return {
+        "size": counter.size,
+        "ends_with_newline": counter.last_byte == b"\n",
+        "cells": cell_count,
+        "populations": populations,
+    }
+
+
+def _scan_rows_csv(fh: BinaryIO, counter: _CountingReader) -> tuple[int, set[str]]:
+    reader = csv.reader(io.TextIOWrapper(fh, encoding="utf-8", newline=""))
+    try:
+        header = next(reader)
+    except StopIteration as exc:
+        if counter.size == 0:
+            raise ValueError("CSV file is empty.") from exc
+        raise ValueError("CSV file has no header row.") from exc
+
+    expected = len(header)
+    if expected == 0:
+        raise ValueError("CSV header has no columns.")
+
+    label_index = _find_label_index(header)
     populations: set[str] = set()
+    cell_count = 0
+    for idx, row in enumerate(reader, start=2):
+        if len(row) != expected:
+            raise ValueError(
+                f"Row {idx} has {len(row)} columns (expected {expected})."
+            )
+        cell_count += 1
+        if label_index is None:
+            continue
+        value = str(row[label_index]).strip()
+        if not value:
+            continue
+        if value.lower() == "unlabeled":
+            continue
+        populations.add(value)
+    return cell_count, populations
 
-    for path in sorted_paths:
-        with open(path, "r", encoding="utf-8", newline="") as fh:
-            reader = csv.reader(fh)
-            try:
-                header = next(reader)
-            except StopIteration as exc:
-                raise ValueError(f"CSV file has no header row: {path.name}") from exc
-            label_index = _find_label_index(header)
-            cell_count = 0
-            for row in reader:
-                cell_count += 1
-                if label_index is None:
-                    continue
-                if label_index >= len(row):
-                    continue
-                value = str(row[label_index]).strip()
-                if not value:
-                    continue
-                if value.lower() == "unlabeled":
-                    continue
+
+def _scan_rows_arrow(
+    fh: BinaryIO, counter: _CountingReader, arrow
+) -> Optional[tuple[int, set[str]]]:
+    # pyarrow's C++ parser checks the column count of every row far faster than
+    # csv.reader. Only the label column is converted. Returns None whenever the
+    # result might differ from the csv module's.
+    pa, pc, pacsv = arrow
+    header_line = fh.readline()
+    if b'"' in header_line or not header_line.strip(b"\r\n"):
+        return None
+    header = header_line.decode("utf-8").rstrip("\r\n").split(",")
+    if len(set(header)) != len(header):
+        return None
+
+    label_index = _find_label_index(header)
+    # Without a label column nothing is converted; the parser still checks the
+    # column count of every row and reports num_rows.
+    if label_index is None:
+        convert_options = pacsv.ConvertOptions(include_columns=[])
+    else:
+        column = header[label_index]
+        convert_options = pacsv.ConvertOptions(
+            column_types={column: pa.string()}, include_columns=[column]
+        )
+    try:
+        table = pacsv.read_csv(
+            fh,
+            read_options=pacsv.ReadOptions(column_names=header, block_size=8 << 20),
+            convert_options=convert_options,
+        )
+    except pa.ArrowInvalid:
+        return None
+
+    # pyarrow skips blank lines and accepts quoted newlines; the csv module
+    # treats those differently, so require one row per physical line.
+    lines = counter.newlines + (0 if counter.last_byte == b"\n" else 1)
+    if table.num_rows != lines - 1:
+        return None
+
+    populations: set[str] = set()
+    if label_index is not None:
+        for value in pc.unique(table.column(0)).to_pylist():
+            value = (value or "").strip()
+            if value and value.lower() != "unlabeled":
                 populations.add(value)
+    return table.num_rows, populations
 
-        sample_names.append(path.name)
-        cells_per_sample.append(cell_count)
+
+def _materialize_one(
+    base: str, typ: str, paths: list[Path], sha_path: Optional[Path]
+) -> tuple[Optional[dict], Optional[dict], Optional[str]]:
+    # Worker-process body for one sample: verifies and scans the decoded CSV.
+    # Returns (entry, sample, error message).
+    entry = {"arcname": f"{base}.csv", "source": paths[0].name, "paths": paths, "typ": typ}
+    if typ == "zst_parts":
+        entry.update(
+            source=f"{base}.csv.zst",
+            paths=sorted(paths, key=lambda p: p.name),
+            typ="zst",
+        )
+    if entry["typ"] == "zst":
+        try:
+            entry["sha256"] = _read_sha256(cast(Path, sha_path))
+        except ValueError as exc:
+            return None, None, f"Checksum failed for {entry['source']}: {exc}"
+
+    dctx = None
+    if entry["typ"] == "zst":
+        import zstandard as zstd  # type: ignore
+
+        dctx = zstd.ZstdDecompressor()
+    try:
+        sample = _scan_csv_source(entry, dctx)
+    except _ChecksumError as exc:
+        return None, None, f"Checksum failed for {entry['source']}: {exc}"
+    except ValueError as exc:
+        return None, None, f"Validation failed for {entry['arcname']}: {exc}"
+    return entry, sample, None
+
+
+def _collect_dataset_metadata(samples: list[dict]) -> dict:
+    sorted_samples = sorted(samples, key=lambda s: s["name"])
+    populations: set[str] = set()
+    for sample in sorted_samples:
+        populations.update(sample["populations"])
 
     return {
-        "sample_count": len(sorted_paths),
-        "sample_names": sample_names,
-        "cells_per_sample": cells_per_sample,
+        "sample_count": len(sorted_samples),
+        "sample_names": [s["name"] for s in sorted_samples],
+        "cells_per_sample": [s["cells"] for s in sorted_samples],
         "population_count": len(populations),
     }
 
 
 def _download_prepared_dataset(
-    dataset_name: str, data_path: str
-) -> Optional[tuple[list[Path], dict]]:
+    dataset_name: str,
+    data_path: str,
+    compression: str = "gz",
+    passthrough_compressed: bool = False,
+    cache_dir: Optional[str] = None,
+    gzip_level: int = 6,
+) -> Optional[tuple[list[str], dict]]:
+    import concurrent.futures
+    import multiprocessing
+    import tarfile
+
+    zstd = None  # type: Optional[object]
+    try:
+        import zstandard as zstd  # type: ignore
+
+        zstd_available = True
+    except Exception:
+        zstd_available = False
+
+    if compression == "zst" and not zstd_available:
+        print(
+            "Error: zstd output requested but Python package 'zstandard' is not installed.",
+            file=sys.stderr,
+        )
+        return None
+
+    # One decompressor (and its decoder tables) is reused for every .zst source.
+    dctx = zstd.ZstdDecompressor() if zstd_available else None  # type: ignore
+
     try:
-        prepared_files = _list_prepared_files(dataset_name)
+        prepared_files = _list_prepared_files(dataset_name, cache_dir)
     except Exception as exc:
         print(exc)
         return None
@@ -218,174 +827,168 @@ def _download_prepared_dataset(
         print(f"No prepared CSV files found in the source repository for '{dataset_name}'.")
         return None
 
-    os.makedirs(os.path.dirname(data_path), exist_ok=True)
-    tmpdir = tempfile.mkdtemp()
-    added = []
-    try:
-        zstd = None  # type: Optional[object]
-        try:
-            import zstandard as zstd  # type: ignore
+    # Pick each sample's source encoding from the listing alone, so only the
+    # chosen files are downloaded and naming problems surface before any transfer.
+    listed = {item["name"]: item for item in prepared_files}
+    by_base: dict[str, dict[str, list[dict]]] = {}
+    for item in prepared_files:
+        if item.get("kind") != "data":
+            continue
+        by_base.setdefault(item["base"], {}).setdefault(item["typ"], []).append(item)
 
-            zstd_available = True
-        except Exception:
-            zstd_available = False
+    if not by_base:
+        print(f"No prepared CSV files found in the source repository for '{dataset_name}'.")
+        return None
 
-        downloaded_paths: list[Path] = []
-        for item in prepared_files:
-            dest = Path(tmpdir) / item["name"]
-            if not download_file(item["url"], str(dest)):
+    work = []
+    for base, by_type in sorted(by_base.items()):
+        typ = next(t for t in _SOURCE_PRIORITY if t in by_type)
+        items = by_type[typ]
+        sha_item = None
+        if typ in ("zst", "zst_parts"):
+            zst_name = items[0]["name"] if typ == "zst" else f"{base}.csv.zst"
+            sha_name = f"{zst_name}.sha256"
+            sha_item = listed.get(sha_name)
+            if sha_item is None:
+                print(
+                    f"Error: missing checksum file {sha_name} for {zst_name}.",
+                    file=sys.stderr,
+                )
                 return None
-            downloaded_paths.append(dest)
-
-        downloaded_by_name = {p.name: p for p in downloaded_paths}
-
-        by_base: dict[str, list[Path]] = {}
-        for item in prepared_files:
-            if item.get("kind") != "data":
-                continue
-            p = downloaded_by_name.get(item["name"])
-            if p is None:
-                continue
-            base = p.name
-            lower_name = p.name.lower()
-            part_marker = ".csv.zst.part"
-            if part_marker in lower_name:
-                base = p.name[: lower_name.index(part_marker)]
-            else:
-                for s in (".csv", ".csv.gz", ".csv.zst"):
-                    if lower_name.endswith(s):
-                        base = p.name[: -len(s)]
-                        break
-            by_base.setdefault(base, []).append(p)
-
-        for base, paths in sorted(by_base.items()):
-            chosen = None
-            for p in paths:
-                if p.name.lower().endswith(".csv") and not p.name.lower().endswith(".csv.gz"):
-                    chosen = (p, "csv")
-                    break
-            if chosen is None:
-                for p in paths:
-                    if p.name.lower().endswith(".csv.gz"):
-                        chosen = (p, "gz")
-                        break
-            if chosen is None:
-                for p in paths:
-                    if p.name.lower().endswith(".csv.zst"):
-                        chosen = (p, "zst")
-                        break
-            if chosen is None:
-                part_marker = ".csv.zst.part"
-                parts = [p for p in paths if part_marker in p.name.lower()]
-                if parts:
-                    chosen = (parts, "zst_parts")
-            if chosen is None:
-                chosen = (paths[0], None)
-
-            src_obj, typ = chosen
-            arcname = f"{base}.csv"
-            target = Path(tmpdir) / arcname
-
-            if typ == "csv":
-                src = cast(Path, src_obj)
-                shutil.copy2(src, target)
-            elif typ == "gz":
-                src = cast(Path, src_obj)
-                with gzip.open(src, "rb") as fh_in, open(target, "wb") as fh_out:
-                    shutil.copyfileobj(cast(BinaryIO, fh_in), fh_out)
-            elif typ == "zst":
-                src = cast(Path, src_obj)
-                sha_name = f"{src.name}.sha256"
-                sha_path = downloaded_by_name.get(sha_name)
-                if sha_path is None:
-                    print(
-                        f"Error: missing checksum file {sha_name} for {src.name}.",
-                        file=sys.stderr,
-                    )
-                    return None
-                try:
-                    _verify_sha256(src, sha_path)
-                except ValueError as exc:
-                    print(
-                        f"Checksum failed for {src.name}: {exc}",
-                        file=sys.stderr,
-                    )
-                    return None
-                if zstd_available and zstd is not None:
-                    with open(src, "rb") as fh_in, open(target, "wb") as fh_out:
-                        dctx = zstd.ZstdDecompressor()
-                        dctx.copy_stream(fh_in, fh_out)
-                else:
-                    print(
-                        "Error: found .zst file but Python package 'zstandard' is not installed; cannot decompress."
-                    )
-                    return None
-            elif typ == "zst_parts":
-                parts = cast(list[Path], src_obj)
-                temp_zst = Path(tmpdir) / f"{base}.csv.zst"
-                with open(temp_zst, "wb") as fh_out:
-                    for part in sorted(parts, key=lambda p: p.name):
-                        with open(part, "rb") as fh_in:
-                            shutil.copyfileobj(cast(BinaryIO, fh_in), fh_out)
-                sha_name = f"{temp_zst.name}.sha256"
-                sha_path = downloaded_by_name.get(sha_name)
-                if sha_path is None:
-                    print(
-                        f"Error: missing checksum file {sha_name} for {temp_zst.name}.",
-                        file=sys.stderr,
-                    )
-                    return None
-                try:
-                    _verify_sha256(temp_zst, sha_path)
-                except ValueError as exc:
-                    print(
-                        f"Checksum failed for {temp_zst.name}: {exc}",
-                        file=sys.stderr,
+            if not zstd_available:
+                kind = "file" if typ == "zst" else "parts"
+                print(
+                    f"Error: found .zst {kind} but Python package 'zstandard' is not installed; cannot decompress."
+                )
+                return None
+        work.append((base, typ, items, sha_item))
+
+    bad_names = [f"{base}.csv" for base, _, _, _ in work if ".sha256" in base]
+    if bad_names:
+        print(
+            "Error: checksum files were packaged as CSVs: "
+            + ", ".join(sorted(bad_names)),
+            file=sys.stderr,
+        )
+        return None
+
+    out_dir = os.path.dirname(data_path)
+    os.makedirs(out_dir, exist_ok=True)
+    # Download scratch space lives next to the output rather than in $TMPDIR,
+    # which is often a small tmpfs on CI. OB_TMPFS=1 opts into /dev/shm instead.
+    scratch_root = out_dir
+    if os.environ.get("OB_TMPFS") == "1" and os.path.isdir("/dev/shm"):
+        scratch_root = "/dev/shm"
+    tmpdir = tempfile.mkdtemp(prefix=".ob-pipeline-", dir=scratch_root)
+    # The tarball is written under a temporary name and renamed into place, so
+    # an interrupted run never leaves a truncated archive at data_path.
+    partial_path = data_path + ".tmp"
+    try:
+        # Downloads run on threads; as soon as every file of a sample is local,
+        # its verify/decode/validate scan is handed to a worker process, so
+        # network transfer and CPU-bound scanning overlap. Only the tar write
+        # below has to stay sequential.
+        scan_args = {}
+        pending: dict[str, int] = {}
+        download_futures = {}
+        scan_futures = {}
+        # Each sample downloads its source files plus, for zstd, a .sha256 file.
+        file_count = sum(
+            len(items) + (1 if sha_item is not None else 0) for _, _, items, sha_item in work
+        )
+        download_workers = min(DOWNLOAD_WORKERS, file_count)
+        scan_workers = min(os.cpu_count() or 1, len(work))
+        # Scan workers start while download threads are running, so they must
+        # not be forked from this process: a fork would copy held locks and the
+        # open keep-alive sockets. forkserver forks from a clean helper process.
+        start_method = (
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=download_workers
+        ) as downloads, concurrent.futures.ProcessPoolExecutor(
+            max_workers=scan_workers, mp_context=multiprocessing.get_context(start_method)
+        ) as scans:
+            for base, typ, items, sha_item in work:
+                needed = items + ([sha_item] if sha_item is not None else [])
+                pending[base] = len(needed)
+                scan_args[base] = (
+                    base,
+                    typ,
+                    [Path(tmpdir) / item["name"] for item in items],
+                    Path(tmpdir) / sha_item["name"] if sha_item is not None else None,
+                )
+                for item in needed:
+                    future = downloads.submit(
+                        download_file,
+                        item["url"],
+                        str(Path(tmpdir) / item["name"]),
+                        cache_dir=cache_dir,
                     )
+                    download_futures[future] = base
+
+            for future in concurrent.futures.as_completed(download_futures):
+                if not future.result():
+                    downloads.shutdown(wait=False, cancel_futures=True)
+                    scans.shutdown(wait=False, cancel_futures=True)
                     return None
-                if zstd_available and zstd is not None:
-                    with open(temp_zst, "rb") as fh_in, open(target, "wb") as fh_out:
-                        dctx = zstd.ZstdDecompressor()
-                        dctx.copy_stream(fh_in, fh_out)
-                else:
-                    print(
-                        "Error: found .zst parts but Python package 'zstandard' is not installed; cannot decompress."
-                    )
+                base = download_futures[future]
+                pending[base] -= 1
+                if pending[base] == 0:
+                    scan_futures[base] = scans.submit(_materialize_one, *scan_args[base])
+
+            entries: list[dict] = []
+            samples: list[dict] = []
+            for base, *_ in work:
+                entry, sample, error = scan_futures[base].result()
+                if error is not None:
+                    print(error, file=sys.stderr)
+                    scans.shutdown(wait=False, cancel_futures=True)
                     return None
-            else:
-                src = cast(Path, src_obj)
-                shutil.copy2(src, target)
-
-            added.append(target)
-
-        bad_names = [p.name for p in added if ".sha256" in p.name]
-        if bad_names:
-            print(
-                "Error: checksum files were packaged as CSVs: "
-                + ", ".join(sorted(bad_names)),
-                file=sys.stderr,
-            )
-            return None
+                entries.append(entry)
+                samples.append(sample)
 
-        for csv_path in added:
-            try:
-                _validate_csv_file(csv_path)
-            except ValueError as exc:
-                print(
-                    f"Validation failed for {csv_path.name}: {exc}",
-                    file=sys.stderr,
-                )
-                return None
+        if passthrough_compressed:
+            # Store validated .csv.gz/.csv.zst sources as-is instead of decoding and
+            # recompressing them. Sources missing a trailing newline are still
+            # decoded so the newline can be appended.
+            for entry, sample in zip(entries, samples):
+                if entry["typ"] != "csv" and sample["ends_with_newline"]:
+                    entry["passthrough"] = True
+                    entry["arcname"] = f"{entry['arcname']}.{entry['typ']}"
+                    sample["name"] = entry["arcname"]
+        members = sorted(zip(entries, samples), key=lambda m: m[0]["arcname"])
 
-        metadata = _collect_dataset_metadata(added)
+        metadata = _collect_dataset_metadata(samples)
 
-        with tarfile.open(data_path, "w:gz") as tar:
-            for p in sorted(added, key=lambda x: x.name):
-                tar.add(p, arcname=p.name)
-        print(f"Packaged {len(added)} CSV files into {data_path}")
-        return added, metadata
+        mtime = int(time.time())
+        # Hand the compressor 1 MiB writes instead of tarfile's 10-16 KiB defaults.
+        with _open_archive_writer(partial_path, compression, gzip_level) as fh, tarfile.open(
+            fileobj=fh, mode="w|", bufsize=1 << 20, copybufsize=1 << 20
+        ) as tar:
+            for entry, sample in members:
+                info = tarfile.TarInfo(name=entry["arcname"])
+                info.mtime = mtime
+                if entry.get("passthrough"):
+                    info.size = sum(p.stat().st_size for p in entry["paths"])
+                    streams = [_open_source_bytes(entry)]
+                else:
+                    # Files missing a trailing newline get one appended in the archive.
+                    info.size = sample["size"] + (0 if sample["ends_with_newline"] else 1)
+                    streams = [_open_csv_source(entry, dctx)]
+                    if not sample["ends_with_newline"]:
+                        streams.append(io.BytesIO(b"\n"))
+                with io.BufferedReader(_ChainedReader(streams), buffer_size=1 << 20) as src_fh:
+                    tar.addfile(info, src_fh)
+        os.replace(partial_path, data_path)
+        print(f"Packaged {len(entries)} CSV files into {data_path}")
+        return [entry["arcname"] for entry, _ in members], metadata
     finally:
+        # The download pool has exited by now, so no thread is using these.
+        _close_connections()
         shutil.rmtree(tmpdir)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
 
 
 def parse_args() -> argparse.Namespace:
@@ -417,6 +1020,31 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="Random seed used to generate the file order output.",
     )
+    parser.add_argument(
+        "--compression",
+        choices=("gz", "zst"),
+        default="gz",
+        help="Compression for the data tarball: gz (<name>.data.tar.gz, default) or zst (<name>.data.tar.zst).",
+    )
+    parser.add_argument(
+        "--gzip-level",
+        type=int,
+        choices=range(1, 10),
+        default=6,
+        metavar="{1..9}",
+        help="Compression level for gzip output (default: 6; 1 is fastest).",
+    )
+    parser.add_argument(
+        "--passthrough-compressed",
+        action="store_true",
+        help="Store .csv.gz/.csv.zst sources as-is in an uncompressed <name>.data.tar (ignores --compression).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Keep downloads here between runs and revalidate them with ETags instead of re-downloading (default: no cache).",
+    )
     parser.add_argument(
         "--sub-sampling",
         type=int,
@@ -435,23 +1063,34 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     args = parse_args()
     outdir = args.output_dir
-    data_filename = f"{args.name}.data.tar.gz"
+    # Passed-through members are already compressed, so the outer tar is left plain.
+    compression = "none" if args.passthrough_compressed else args.compression
+    data_filename = f"{args.name}.data.tar"
+    if compression != "none":
+        data_filename += f".{compression}"
     data_path = os.path.abspath(os.path.join(outdir, data_filename))
 
-    downloaded = _download_prepared_dataset(args.dataset_name, data_path)
+    downloaded = _download_prepared_dataset(
+        args.dataset_name,
+        data_path,
+        compression,
+        args.passthrough_compressed,
+        args.cache_dir,
+        args.gzip_level,
+    )
     if downloaded is not None:
-        csv_paths, metadata = downloaded
+        csv_names, metadata = downloaded
         attachments_path = os.path.abspath(os.path.join(outdir, f"{args.name}.attachments.gz"))
-        with gzip.open(attachments_path, "wb") as lh:
+        with _open_parallel_gzip(attachments_path) as lh:
             lh.write(b"")
         print(f"Wrote empty attachments file: {attachments_path}")
 
-        order = list(range(1, len(csv_paths) + 1))
+        order = list(range(1, len(csv_names) + 1))
         random.Random(args.seed).shuffle(order)
         order_path = os.path.abspath(os.path.join(outdir, f"{args.name}.order.json.gz"))
         metadata["sub_sampling"] = args.sub_sampling
-        with gzip.open(order_path, "wt", encoding="utf-8") as oh:
-            json.dump({"order": order, "metadata": metadata}, oh)
+        with _open_parallel_gzip(order_path) as oh:
+            oh.write(json.dumps({"order": order, "metadata": metadata}).encode("utf-8"))
         print(f"Wrote order file: {order_path}")
         print(f"Dataset saved to: {data_path}")
         return
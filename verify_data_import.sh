@@ -8,10 +8,16 @@ if [[ ! -f "$archive" ]]; then
   exit 1
 fi
 
+case "$archive" in
+  *.zst) list_cmd=(tar --zstd -tf) ;;
+  *.tar) list_cmd=(tar -tf) ;;
+  *) list_cmd=(tar -tzf) ;;
+esac
+
 echo "Listing CSV files in $archive..."
-tar -tzf "$archive" | tee /tmp/prepared_csv_list.txt
+"${list_cmd[@]}" "$archive" | tee /tmp/prepared_csv_list.txt
 
 echo
 echo "Summary:"
 echo "Total entries: $(wc -l < /tmp/prepared_csv_list.txt)"
-echo "Non-CSV entries (should be 0): $(grep -v -i '\.csv$' /tmp/prepared_csv_list.txt | wc -l)"
+echo "Non-CSV entries (should be 0): $(grep -v -i -E '\.csv(\.gz|\.zst)?$' /tmp/prepared_csv_list.txt | wc -l)"